@@ -0,0 +1,42 @@
+import gc
+import tracemalloc
+from argparse import ArgumentParser
+from random import Random
+import manager as manager_module
+from manager import Manager
+from fuzz_manager import OnosStub
+
+
+def main():
+    parser = ArgumentParser(description='Pomiar pamięci zajmowanej przez sesje')
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--network', default='network.json')
+    args = parser.parse_args()
+    stub = OnosStub()
+    manager_module.post = stub.post
+    manager = Manager(args.network)
+    manager.set_onos_ip('onos-stub')
+    # Every session is a ping between a random pair of hosts, so duplicates
+    # are allowed to reach the requested count on a small network.
+    manager.find_same_session = lambda *_: None
+    rng = Random(0)
+    pairs = [rng.sample(manager.switches, 2) for _ in range(args.sessions)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for host_a, host_b in pairs:
+        manager.add_path(host_a, host_b, 'PING', 0)
+        # Only the manager's own state is measured, not the stub's copies.
+        stub.flows.clear()
+        stub.calls.clear()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    hops = sum(len(s.path) - 1 for s in manager.sessions) / len(
+        manager.sessions)
+    print(f'Sesje: {len(manager.sessions)}, średnio łączy na ścieżce: '
+          f'{hops:.2f}, pamięć: {used / len(manager.sessions):.0f} B/sesję')
+
+
+if __name__ == '__main__':
+    main()
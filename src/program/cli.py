@@ -143,6 +143,21 @@ def end_session(args):
     print(f"Usunięto sesję")
 
 
+def reroute_session(args):
+    if not verify_args_length(1, args):
+        return
+    if (session_id := verify_int(args[0])) is None:
+        return
+    if session_id not in sessions:
+        print(f'Nie ma sesji o ID {session_id}')
+        return
+    if not manager.reroute(sessions[session_id]):
+        print('Nie udało się wyznaczyć nowej ścieżki, sesja pozostaje bez zm'
+              'ian')
+        return
+    print(manager.display_session(sessions[session_id], session_id))
+
+
 def source_file(args):
     global scheduled_commands
     if not verify_args_length(1, args):
@@ -183,6 +198,7 @@ def main():
         'start': start_session,
         'list': list_sessions,
         'end': end_session,
+        'reroute': reroute_session,
         'source': source_file,
         'test': test_link,
         'exit': exit_program,
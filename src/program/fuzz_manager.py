@@ -0,0 +1,374 @@
+import json
+import os
+import sys
+from importlib import import_module
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+from random import Random
+from tempfile import NamedTemporaryFile
+from networkx import Graph, shortest_path_length, NetworkXNoPath, \
+    NodeNotFound
+
+EPSILON = 1e-9
+SESSION_TYPES = ('PING', 'TCP', 'UDP')
+
+
+class StubResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return self.content
+
+
+class OnosStub:
+    def __init__(self):
+        self.flows = {}
+        self.flow_ids = {}
+        self.calls = []
+
+    def post(self, url, headers=None, data=None, auth=None):
+        created = []
+        self.calls.append(('POST', json.loads(data)['flows']))
+        for flow in self.calls[-1][1]:
+            # Like ONOS, the flow ID is a 64-bit value depending on the device
+            # and selector only, so a flow with a known selector replaces the
+            # installed one.
+            selector = (flow['deviceId'],
+                        json.dumps(flow['selector'], sort_keys=True))
+            flow_id = self.flow_ids.setdefault(
+                selector, str(len(self.flow_ids) + 10 ** 16))
+            self.flows[(flow['deviceId'], flow_id)] = flow
+            created.append({'deviceId': flow['deviceId'], 'flowId': flow_id})
+        return StubResponse({'flows': created})
+
+    def delete(self, url, headers=None, data=None, auth=None):
+        if data is None:
+            removed = [url.split('/')[-2:]]
+        else:
+            removed = [(f['deviceId'], f['flowId'])
+                       for f in json.loads(data)['flows']]
+        self.calls.append(('DELETE', removed))
+        for device, flow_id in removed:
+            if self.flows.pop((device, flow_id), None) is None:
+                raise AssertionError(f'Usunięto nieistniejący przepływ '
+                                     f'{device}/{flow_id}')
+        return StubResponse({})
+
+
+class ReferenceModel:
+    def __init__(self, topology):
+        self.cities = topology['cities']
+        self.links = topology['links']
+        self.loads = [{t: {} for t in SESSION_TYPES} for _ in self.links]
+        self.pairs = {}
+        self.sessions = {}
+        for i, link in enumerate(self.links):
+            a = self.cities.index(link['city_a']) + 1
+            b = self.cities.index(link['city_b']) + 1
+            self.pairs[frozenset((a, b))] = i
+
+    def admits(self, link_index, session_type, bandwidth):
+        if session_type == 'PING':
+            return True
+        load = self.loads[link_index]
+        capacity = self.links[link_index]['bandwidth']
+        udp = sum(load['UDP'].values())
+        tcp = list(load['TCP'].values())
+        if session_type == 'UDP':
+            return bandwidth <= capacity - max(tcp, default=0) * len(tcp) - udp
+        share = (capacity - udp) / (len(tcp) + 1)
+        return bandwidth <= share and all(share >= t for t in tcp)
+
+    def blocked(self, a, b, session_type):
+        same = [t for (x, y, t) in self.sessions.values() if {x, y} == {a, b}]
+        if session_type == 'PING' and same:
+            return True
+        return session_type in same or 'PING' in same
+
+    def route_delay(self, a, b, session_type, bandwidth):
+        network = Graph()
+        for i, link in enumerate(self.links):
+            if self.admits(i, session_type, bandwidth):
+                network.add_edge(link['city_a'], link['city_b'],
+                                 delay=link['delay'])
+        try:
+            return shortest_path_length(network, self.cities[a - 1],
+                                        self.cities[b - 1], weight='delay')
+        except (NodeNotFound, NetworkXNoPath):
+            return None
+
+    def link_indices(self, path):
+        return [self.pairs[frozenset((a, b))] for a, b in zip(path, path[1:])]
+
+    def add(self, token, a, b, session_type, bandwidth, path):
+        self.sessions[token] = (a, b, session_type)
+        for i in self.link_indices(path):
+            self.loads[i][session_type][token] = bandwidth
+
+    def remove(self, token):
+        a, b, session_type = self.sessions.pop(token)
+        bandwidth = None
+        for load in self.loads:
+            bandwidth = load[session_type].pop(token, bandwidth)
+        return a, b, session_type, bandwidth
+
+
+def generate_topology(rng, size):
+    cities = [f'Miasto{i + 1}' for i in range(size)]
+    pairs = {frozenset((i, rng.randrange(i))) for i in range(1, size)}
+    while len(pairs) < size - 1 + rng.randint(0, size):
+        a, b = rng.sample(range(size), 2)
+        pairs.add(frozenset((a, b)))
+    ports = [1] * size
+    links = []
+    for a, b in sorted(tuple(sorted(p)) for p in pairs):
+        ports[a] += 1
+        ports[b] += 1
+        links.append({
+            'city_a': cities[a],
+            'city_b': cities[b],
+            'delay': rng.uniform(0.5, 5),
+            'bandwidth': rng.choice((5, 10, 20)),
+            'port_a': str(ports[a]),
+            'port_b': str(ports[b])
+        })
+    return {'cities': cities, 'links': links}
+
+
+def check_invariants(manager, reference, live, stub):
+    if [s for _, s in live] != manager.sessions:
+        raise AssertionError('Lista sesji menedżera różni się od oczekiwanej')
+    expected = {link.index: set() for link in manager.links}
+    for token, session in live:
+        for i in reference.link_indices(session.path):
+            expected[i].add(token)
+    tokens = {id(s): t for t, s in live}
+    for link in manager.links:
+        udp = sum(s.bandwidth for s in link.udp_sessions)
+        tcp = max((s.bandwidth for s in link.tcp_sessions), default=0) * len(
+            link.tcp_sessions)
+        if udp + tcp > link.max_bandwidth + EPSILON:
+            raise AssertionError(f'Łącze {link.index} przekroczyło '
+                                 f'przepustowość: {udp + tcp} > '
+                                 f'{link.max_bandwidth}')
+        members = {}
+        for session_type, sessions in (('UDP', link.udp_sessions),
+                                       ('TCP', link.tcp_sessions),
+                                       ('PING', link.ping_sessions)):
+            for s in sessions:
+                if s.session_type != session_type or id(s) not in tokens:
+                    raise AssertionError(f'Nieprawidłowa sesja na łączu '
+                                         f'{link.index}')
+                members[tokens[id(s)]] = s.bandwidth
+        if len(members) != sum(len(s) for s in (link.udp_sessions,
+                                                link.tcp_sessions,
+                                                link.ping_sessions)):
+            raise AssertionError(f'Powielona sesja na łączu {link.index}')
+        if set(members) != expected[link.index]:
+            raise AssertionError(f'Sesje na łączu {link.index} nie zgadzają '
+                                 f'się ze ścieżkami')
+        reference_members = {}
+        for load in reference.loads[link.index].values():
+            reference_members.update(load)
+        if members != reference_members:
+            raise AssertionError(f'Łącze {link.index} różni się od modelu '
+                                 f'referencyjnego')
+    flows = set()
+    for _, session in live:
+        if len(session.flows) != 2 * len(session.path):
+            raise AssertionError('Nieprawidłowa liczba przepływów sesji')
+        flows.update((manager.switches[device].device, str(flow_id))
+                     for device, flow_id in session.flows)
+    if flows != set(stub.flows):
+        raise AssertionError('Przepływy w ONOS nie zgadzają się z sesjami')
+
+
+def apply_add(manager, reference, live, rng, token):
+    host_a, host_b = rng.sample(manager.switches, 2)
+    session_type = rng.choice(SESSION_TYPES)
+    bandwidth = 0 if session_type == 'PING' else round(rng.uniform(0.5, 8), 1)
+    a, b = host_a.number, host_b.number
+    blocked = reference.blocked(a, b, session_type)
+    delay = None if blocked else reference.route_delay(a, b, session_type,
+                                                       bandwidth)
+    admitted = [i for i in range(len(reference.links))
+                if reference.admits(i, session_type, bandwidth)]
+    session = manager.add_path(host_a, host_b, session_type, bandwidth)
+    if delay is None:
+        if session is not None:
+            raise AssertionError(f'Menedżer przyjął sesję {session_type} '
+                                 f'{bandwidth} między {a} i {b}, której '
+                                 f'model referencyjny nie przyjmuje')
+        return
+    if session is None:
+        raise AssertionError(f'Menedżer odrzucił sesję {session_type} '
+                             f'{bandwidth} między {a} i {b}')
+    check_path(reference, session.path, a, b, admitted, delay)
+    reference.add(token, a, b, session_type, bandwidth, session.path)
+    live.append((token, session))
+
+
+def apply_reroute(manager, reference, live, rng, stub):
+    token, session = live[rng.randrange(len(live))]
+    old_path = session.path
+    old_flows = installed_flows(manager, session, stub)
+    stub.calls.clear()
+    a, b, session_type, bandwidth = reference.remove(token)
+    delay = reference.route_delay(a, b, session_type, bandwidth)
+    admitted = [i for i in range(len(reference.links))
+                if reference.admits(i, session_type, bandwidth)]
+    result = manager.reroute(session)
+    if delay is None:
+        if result is not None or session.path != old_path:
+            raise AssertionError(f'Menedżer zmienił ścieżkę {old_path}, dla '
+                                 f'której model referencyjny nie ma '
+                                 f'alternatywy')
+    else:
+        if result is not session:
+            raise AssertionError(f'Menedżer nie zmienił ścieżki {old_path}')
+        check_path(reference, session.path, a, b, admitted, delay)
+    if session.path == old_path:
+        if stub.calls:
+            raise AssertionError('Menedżer zmienił przepływy bez zmiany '
+                                 'ścieżki')
+    else:
+        check_delta(old_flows, installed_flows(manager, session, stub),
+                    stub.calls)
+    reference.add(token, a, b, session_type, bandwidth, session.path)
+
+
+def installed_flows(manager, session, stub):
+    handles = [(manager.switches[device].device, str(flow_id))
+               for device, flow_id in session.flows]
+    return {h: stub.flows[h] for h in handles}
+
+
+def flow_selector(flow):
+    return flow['deviceId'], json.dumps(flow['selector'], sort_keys=True)
+
+
+def check_delta(old_flows, new_flows, calls):
+    old = {json.dumps(f, sort_keys=True) for f in old_flows.values()}
+    new = {json.dumps(f, sort_keys=True) for f in new_flows.values()}
+    posted = [json.dumps(f, sort_keys=True)
+              for method, flows in calls if method == 'POST' for f in flows]
+    if sorted(posted) != sorted(new - old):
+        raise AssertionError('Wysłane przepływy różnią się od różnicy '
+                             'między nową i starą ścieżką')
+    selectors = {flow_selector(f) for f in new_flows.values()}
+    deleted = [tuple(h) for method, handles in calls if method == 'DELETE'
+               for h in handles]
+    if sorted(deleted) != sorted(h for h, f in old_flows.items()
+                                 if flow_selector(f) not in selectors):
+        raise AssertionError('Usunięte przepływy różnią się od przepływów '
+                             'nieużywanych przez nową ścieżkę')
+    # Make-before-break: flows on switches new to the path, then flows
+    # overwriting an installed selector, then deletes.
+    old_selectors = {flow_selector(f) for f in old_flows.values()}
+    phase = 0
+    for method, flows in calls:
+        if method == 'DELETE':
+            call_phase = 2
+        else:
+            kinds = {flow_selector(f) in old_selectors for f in flows}
+            if len(kinds) > 1:
+                raise AssertionError('Nowe i nadpisywane przepływy wysłano w '
+                                     'jednym żądaniu')
+            call_phase = 1 if True in kinds else 0
+        if call_phase < phase:
+            raise AssertionError('Przepływy wysłano lub usunięto w złej '
+                                 'kolejności')
+        phase = call_phase
+
+
+def check_path(reference, path, a, b, admitted, delay):
+    if path[0] != a or path[-1] != b:
+        raise AssertionError(f'Ścieżka {path} nie łączy {a} i {b}')
+    indices = reference.link_indices(path)
+    if any(i not in admitted for i in indices):
+        raise AssertionError(f'Ścieżka {path} używa łącza bez wolnej '
+                             f'przepustowości')
+    path_delay = sum(reference.links[i]['delay'] for i in indices)
+    if abs(path_delay - delay) > EPSILON:
+        raise AssertionError(f'Ścieżka {path} nie jest najkrótsza: '
+                             f'{path_delay} > {delay}')
+
+
+def load_manager(path):
+    module_name, class_name = path.split(':')
+    return getattr(import_module(module_name), class_name)
+
+
+def run_sequence(seed, operations, manager_path='manager:Manager'):
+    rng = Random(seed)
+    topology = generate_topology(rng, rng.randint(3, 12))
+    with NamedTemporaryFile('w', suffix='.json', delete=False) as file:
+        file.write(json.dumps(topology))
+    manager_class = load_manager(manager_path)
+    try:
+        manager = manager_class(file.name)
+    finally:
+        os.remove(file.name)
+    manager.set_onos_ip('onos-stub')
+    stub = OnosStub()
+    for cls in manager_class.__mro__[:-1]:
+        manager_module = sys.modules[cls.__module__]
+        manager_module.post = stub.post
+        manager_module.delete = stub.delete
+    reference = ReferenceModel(topology)
+    live = []
+    step = 0
+    with open(os.devnull, 'w') as sink:
+        try:
+            for step in range(operations):
+                with redirect_stdout(sink):
+                    action = rng.random()
+                    if live and action < 0.3:
+                        token, session = live.pop(rng.randrange(len(live)))
+                        manager.remove_session(session)
+                        reference.remove(token)
+                    elif live and action < 0.5:
+                        apply_reroute(manager, reference, live, rng, stub)
+                    else:
+                        apply_add(manager, reference, live, rng, step)
+                check_invariants(manager, reference, live, stub)
+            step = operations
+            for token, session in live:
+                manager.remove_session(session)
+            if stub.flows or any(l.udp_sessions or l.tcp_sessions or
+                                 l.ping_sessions for l in manager.links):
+                raise AssertionError('Po usunięciu wszystkich sesji sieć nie '
+                                     'jest pusta')
+        except Exception as e:
+            return seed, step, f'{type(e).__name__}: {e}'
+    return None
+
+
+def run_worker(args):
+    return run_sequence(*args)
+
+
+def main():
+    parser = ArgumentParser(description='Losowe testy różnicowe menedżera')
+    parser.add_argument('--sequences', type=int, default=1000)
+    parser.add_argument('--operations', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--manager', default='manager:Manager',
+                        help='testowana klasa w postaci moduł:Klasa')
+    args = parser.parse_args()
+    tasks = [(args.seed + i, args.operations, args.manager)
+             for i in range(args.sequences)]
+    with Pool(args.workers) as pool:
+        failures = [f for f in pool.imap_unordered(run_worker, tasks) if f]
+    for seed, step, message in sorted(failures):
+        print(f'Ziarno {seed}, krok {step}: {message}')
+    print(f'Wykonano {args.sequences} sekwencji po {args.operations} '
+          f'operacji, błędy: {len(failures)}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,32 @@
 import json
 from copy import copy
+from sys import intern
 from requests import post, delete
-from networkx import Graph, shortest_path, NodeNotFound
+from networkx import Graph, shortest_path, NodeNotFound, NetworkXNoPath
 
 
 class Switch:
+    __slots__ = ('name', 'number', 'ip', 'device')
+
     def __init__(self, name, index):
         self.name = name
         self.number = index + 1
-        self.ip = f'10.0.0.{self.number}/32'
+        self.ip = intern(f'10.0.0.{self.number}/32')
         h = str(hex(self.number)[2:])
-        self.device = 'of:' + '0' * (16 - len(h)) + h
+        self.device = intern('of:' + '0' * (16 - len(h)) + h)
 
 
 class Link:
+    __slots__ = ('index', 'switch_a', 'port_a', 'switch_b', 'port_b', 'delay',
+                 'max_bandwidth', 'tcp_sessions', 'udp_sessions',
+                 'ping_sessions')
+
     def __init__(self, index, link_data, get_switch_function):
         self.index = index
         self.switch_a = get_switch_function(link_data['city_a'])
-        self.port_a = link_data['port_a']
+        self.port_a = intern(link_data['port_a'])
         self.switch_b = get_switch_function(link_data['city_b'])
-        self.port_b = link_data['port_b']
+        self.port_b = intern(link_data['port_b'])
         self.delay = link_data['delay']
         self.max_bandwidth = link_data['bandwidth']
         self.tcp_sessions = []
@@ -78,19 +85,23 @@ class Link:
 
 
 class Session:
+    __slots__ = ('host_a', 'host_b', 'session_type', 'bandwidth', 'flows',
+                 'path')
+
     def __init__(self, host_a, host_b, session_type, requested_bandwidth):
         self.host_a = host_a
         self.host_b = host_b
-        self.session_type = session_type
+        self.session_type = intern(session_type)
         self.bandwidth = requested_bandwidth
-        self.flows = []
-        self.path = []
+        self.flows = ()
+        self.path = ()
 
     def set_path(self, path):
-        self.path = path
+        self.path = tuple(path)
 
-    def add_flows(self, result):
-        self.flows.extend(result['flows'])
+    def set_flows(self, flows):
+        # (device index, flow ID) pairs in the order of Manager.path_flows.
+        self.flows = tuple(flows)
 
 
 def create_flow(device, out_port, in_port_crit, src_crit, dest_crit,
@@ -138,6 +149,11 @@ def create_flow(device, out_port, in_port_crit, src_crit, dest_crit,
     return result
 
 
+def flow_match(flow):
+    device, _, in_port, src, dest = flow
+    return device, in_port, src, dest
+
+
 def generate_iperf(session):
     if session.session_type == 'PING':
         return
@@ -164,6 +180,7 @@ class Manager:
                          enumerate(content['cities'])]
         self.links = [Link(i, link, lambda s: self.get_switch(s)) for i, link
                       in enumerate(content['links'])]
+        self.devices = {s.device: i for i, s in enumerate(self.switches)}
         self.sessions = []
 
     def set_onos_ip(self, onos_ip):
@@ -174,7 +191,7 @@ class Manager:
             return shortest_path(graph, u, v,
                                  weight=lambda _u, _v, l: self.links[
                                      l['link_index']].delay)
-        except NodeNotFound:
+        except (NodeNotFound, NetworkXNoPath):
             return []
 
     def find_shortest(self, session):
@@ -219,49 +236,45 @@ class Manager:
         if not (path := self.find_shortest(session)):
             return None
         session.set_path(path)
-        result = {'flows': []}
         links = [self.get_link(a, b) for a, b in zip(path, path[1:])]
         for link in links:
             link.add_session(session)
-        result['flows'].append(create_flow(
-            city_a.device, 1, links[0].port_a, city_b.ip, city_a.ip,
-            session_type))
-        result['flows'].append(create_flow(
-            city_b.device, 1, links[-1].port_b, city_a.ip, city_b.ip,
-            session_type))
+        session.set_flows(self.post_flows(session,
+                                          self.path_flows(session, links)))
+        self.sessions.append(session)
+        return session
+
+    def path_flows(self, session, links):
+        city_a, city_b = session.host_a, session.host_b
+        flows = [
+            (city_a.device, 1, links[0].port_a, city_b.ip, city_a.ip),
+            (city_b.device, 1, links[-1].port_b, city_a.ip, city_b.ip)
+        ]
         for i, link in enumerate(links):
             if i == 0:
                 previous_port = '1'
             else:
                 previous_port = links[i - 1].port_b
-            result['flows'].append(create_flow(
-                link.switch_a.device,
-                link.port_a,
-                previous_port,
-                city_a.ip,
-                city_b.ip,
-                session_type
-            ))
+            flows.append((link.switch_a.device, link.port_a, previous_port,
+                          city_a.ip, city_b.ip))
             if i == len(links) - 1:
                 previous_port = '1'
             else:
                 previous_port = links[i + 1].port_a
-            result['flows'].append(create_flow(
-                link.switch_b.device,
-                link.port_b,
-                previous_port,
-                city_b.ip,
-                city_a.ip,
-                session_type
-            ))
+            flows.append((link.switch_b.device, link.port_b, previous_port,
+                          city_b.ip, city_a.ip))
+        return flows
+
+    def post_flows(self, session, flows):
+        result = {'flows': [create_flow(*f, session.session_type)
+                            for f in flows]}
         response = post(f'http://{self.onos_ip}:8181/onos/v1/flows',
                         headers={'Accept': 'application/json',
                                  'Content-Type': 'application/json'},
                         data=json.dumps(result),
                         auth=('onos', 'rocks'))
-        session.add_flows(response.json())
-        self.sessions.append(session)
-        return session
+        return [(self.devices[f['deviceId']], int(f['flowId']))
+                for f in response.json()['flows']]
 
     def remove_session(self, removed):
         links = [self.get_link(a, b) for a, b in
@@ -269,12 +282,53 @@ class Manager:
         for link in links:
             link.remove_session(removed)
         self.sessions.remove(removed)
-        for flow in removed.flows:
+        for device, flow_id in removed.flows:
             delete(f'http://{self.onos_ip}:8181/onos/v1/flows/'
-                   f'{flow["deviceId"]}/{flow["flowId"]}',
+                   f'{self.switches[device].device}/{flow_id}',
                    headers={'Accept': 'application/json'},
                    auth=('onos', 'rocks'))
 
+    def reroute(self, session):
+        old_links = [self.get_link(a, b) for a, b in
+                     zip(session.path, session.path[1:])]
+        for link in old_links:
+            link.remove_session(session)
+        path = self.find_shortest(session)
+        if not path or tuple(path) == session.path:
+            for link in old_links:
+                link.add_session(session)
+            return session if path else None
+        old_flows = dict(zip(self.path_flows(session, old_links),
+                             session.flows))
+        session.set_path(path)
+        links = [self.get_link(a, b) for a, b in zip(path, path[1:])]
+        for link in links:
+            link.add_session(session)
+        flows = self.path_flows(session, links)
+        matches = {flow_match(f) for f in flows}
+        removed = [{'deviceId': self.switches[device].device,
+                    'flowId': str(flow_id)}
+                   for f, (device, flow_id) in old_flows.items()
+                   if flow_match(f) not in matches]
+        # Flows with an unchanged selector are overwritten in place by ONOS
+        # and switch traffic to the new path, so they are pushed only once
+        # the flows on switches new to the path are installed. Flows matching
+        # on a selector absent from the new path are deleted last.
+        old_matches = {flow_match(f) for f in old_flows}
+        added = [f for f in flows if f not in old_flows]
+        for batch in ([f for f in added if flow_match(f) not in old_matches],
+                      [f for f in added if flow_match(f) in old_matches]):
+            if batch:
+                old_flows.update(zip(batch, self.post_flows(session, batch)))
+        session.set_flows(old_flows[f] for f in flows)
+        if removed:
+            delete(f'http://{self.onos_ip}:8181/onos/v1/flows',
+                   headers={'Accept': 'application/json',
+                            'Content-Type': 'application/json'},
+                   data=json.dumps({'flows': removed}),
+                   auth=('onos', 'rocks'))
+        return session
+
     def display_session(self, session, session_id):
         return (f'[{session_id}]: Type: {session.session_type}, Requested: '
                 f'{session.bandwidth} Mb/s, Estimate: '